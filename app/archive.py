@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import struct
+import zlib
+from datetime import date, datetime
+from enum import Enum
+from typing import Dict, Iterator, List, Optional
+
+
+DATETIME_COLUMNS = ("timestamp", "expires_at")
+# columns whose values are listed in the segment header, so find() inflates only the matching segment
+KEY_COLUMNS = ("id", "client_order_id")
+_HEADER = struct.Struct("<I")
+
+
+def _encode(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class Archive:
+    # Segments laid out as <root>/<table>/<ticker>/<day>/<seq>.seg, only rewritten when a user is
+    # deleted. A segment is a length-prefixed compressed header (row count, user ids, time range)
+    # followed by the compressed columns, so readers can skip a segment without inflating its data.
+    def __init__(self, root: str):
+        self.root = root
+        self._headers: Dict[str, dict] = {}
+
+    def clear(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+        self._headers.clear()
+
+    def drop(self, table: str, ticker: str) -> None:
+        path = os.path.join(self.root, table, ticker)
+        shutil.rmtree(path, ignore_errors=True)
+        self._headers = {p: h for p, h in self._headers.items() if not p.startswith(path + os.sep)}
+
+    def drop_user(self, table: str, user_id: str) -> int:
+        # rewrites in place every segment holding the user's rows without them; returns the rows removed
+        removed = 0
+        for path in self.segments(table):
+            users = self._header(path)["users"]
+            if users is None or user_id not in users:
+                continue
+            rows = list(self._read_segment(path))
+            kept = [row for row in rows if row["user_id"] != user_id]
+            removed += len(rows) - len(kept)
+            if kept:
+                self._write_segment(path, kept)
+            else:
+                os.remove(path)
+                self._headers.pop(path, None)
+        return removed
+
+    def write(self, table: str, ticker: str, day: date, rows: List[dict]) -> str:
+        directory = os.path.join(self.root, table, ticker, day.isoformat())
+        os.makedirs(directory, exist_ok=True)
+        existing = [int(name[:-4]) for name in os.listdir(directory) if name.endswith(".seg")]
+        path = os.path.join(directory, f"{max(existing, default=0) + 1:06d}.seg")
+        self._write_segment(path, rows)
+        return path
+
+    def _write_segment(self, path: str, rows: List[dict]) -> None:
+        columns = {name: [_encode(row[name]) for row in rows] for name in rows[0]}
+        header = {
+            "rows": len(rows),
+            "users": sorted(set(columns["user_id"])) if "user_id" in columns else None,
+            "first": columns["timestamp"][0],
+            "last": columns["timestamp"][-1],
+            "keys": {name: sorted({v for v in columns[name] if v is not None}) for name in KEY_COLUMNS if name in columns},
+        }
+        raw_header = zlib.compress(json.dumps(header).encode())
+        raw_columns = zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 6)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(len(raw_header)))
+            f.write(raw_header)
+            f.write(raw_columns)
+        os.replace(tmp_path, path)
+        self._headers[path] = self._index(header)
+
+    @staticmethod
+    def _index(header: dict) -> dict:
+        header["keys"] = {name: set(values) for name, values in header.get("keys", {}).items()}
+        return header
+
+    def _header(self, path: str) -> dict:
+        header = self._headers.get(path)
+        if header is None:
+            with open(path, "rb") as f:
+                (size,) = _HEADER.unpack(f.read(_HEADER.size))
+                header = self._headers[path] = self._index(json.loads(zlib.decompress(f.read(size))))
+        return header
+
+    def _columns(self, path: str) -> dict:
+        with open(path, "rb") as f:
+            (size,) = _HEADER.unpack(f.read(_HEADER.size))
+            f.seek(size, os.SEEK_CUR)
+            return json.loads(zlib.decompress(f.read()))
+
+    def segments(self, table: str, ticker: Optional[str] = None, newest_first: bool = False) -> List[str]:
+        table_dir = os.path.join(self.root, table)
+        if not os.path.isdir(table_dir):
+            return []
+        tickers = [ticker] if ticker is not None else sorted(os.listdir(table_dir))
+        paths = []
+        for t in tickers:
+            ticker_dir = os.path.join(table_dir, t)
+            if not os.path.isdir(ticker_dir):
+                continue
+            for day in sorted(os.listdir(ticker_dir)):
+                day_dir = os.path.join(ticker_dir, day)
+                paths.extend(os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir)) if name.endswith(".seg"))
+        if newest_first:
+            paths.sort(key=lambda p: (os.path.basename(os.path.dirname(p)), p), reverse=True)
+        else:
+            paths.sort(key=lambda p: (os.path.basename(os.path.dirname(p)), p))
+        return paths
+
+    def read(self, table: str, ticker: Optional[str] = None, user_id: Optional[str] = None,
+             newest_first: bool = False, paths: Optional[List[str]] = None) -> Iterator[dict]:
+        # paths pins a segment list taken earlier; those dropped since are skipped
+        if paths is None:
+            paths = self.segments(table, ticker, newest_first)
+        for path in paths:
+            try:
+                if user_id is not None:
+                    users = self._header(path)["users"]
+                    if users is None or user_id not in users:
+                        continue
+                rows = self._read_segment(path)
+            except FileNotFoundError:
+                continue
+            if newest_first:
+                rows = reversed(list(rows))
+            for row in rows:
+                if user_id is None or row.get("user_id") == user_id:
+                    yield row
+
+    def _read_segment(self, path: str) -> Iterator[dict]:
+        columns = self._columns(path)
+        names = list(columns)
+        for name in DATETIME_COLUMNS:
+            if name in columns:
+                columns[name] = [None if v is None else datetime.fromisoformat(v) for v in columns[name]]
+        return (dict(zip(names, values)) for values in zip(*(columns[name] for name in names)))
+
+    def find(self, table: str, column: str, value, user_id: Optional[str] = None) -> Optional[dict]:
+        # point lookup by a KEY_COLUMNS value; segments are ruled out from their cached headers
+        for path in self.segments(table, newest_first=True):
+            header = self._header(path)
+            if user_id is not None and (header["users"] is None or user_id not in header["users"]):
+                continue
+            if value not in header["keys"].get(column, ()):
+                continue
+            for row in self._read_segment(path):
+                if row[column] == value and (user_id is None or row.get("user_id") == user_id):
+                    return row
+        return None
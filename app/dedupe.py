@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+
+class ClientOrderIndex:
+    # Recently used (user id, client order id) -> order id pairs, least recently used evicted first.
+    # Until the first eviction the index holds every id and a miss means the id is new; after that
+    # the unique index on orders stays authoritative for ids that have fallen out.
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.complete = True
+
+    def load(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        # rows of (user id, client order id, order id), oldest first
+        self.entries.clear()
+        self.complete = True
+        for user_id, client_order_id, order_id in rows:
+            self.put(user_id, client_order_id, order_id)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, user_id: str, client_order_id: str) -> Optional[str]:
+        key = (user_id, client_order_id)
+        order_id = self.entries.get(key)
+        if order_id is not None:
+            self.entries.move_to_end(key)
+        return order_id
+
+    def put(self, user_id: str, client_order_id: str, order_id: str) -> None:
+        key = (user_id, client_order_id)
+        self.entries[key] = order_id
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.complete = False
+
+    def discard(self, user_id: str, client_order_id: str) -> None:
+        self.entries.pop((user_id, client_order_id), None)
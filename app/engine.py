@@ -0,0 +1,523 @@
+import bisect
+import heapq
+import math
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+from models import Direction, SelfTradePrevention
+
+
+BUY, SELL = 0, 1
+# plan actions: a trade, a resting order cancelled or decremented by self-trade prevention,
+# and the end of matching for the incoming order
+FILL, STP_CANCEL, STP_DECREMENT, STP_STOP = range(4)
+
+
+def side_of(direction: Direction) -> int:
+    return BUY if direction == Direction.BUY else SELL
+
+
+class Interner:
+    __slots__ = ("index", "values")
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+
+    def get(self, value: str) -> Optional[int]:
+        return self.index.get(value)
+
+
+class OrderArena:
+    # Resting orders live in parallel typed arrays addressed by integer handles,
+    # the UUID is kept as 16 raw bytes and only rendered back to str at the API boundary.
+    __slots__ = ("price", "qty", "filled", "user", "ticker", "side", "ids", "_free")
+
+    def __init__(self):
+        self.price = array("q")
+        self.qty = array("q")
+        self.filled = array("q")
+        self.user = array("i")
+        self.ticker = array("i")
+        self.side = array("b")
+        self.ids = bytearray()
+        self._free = array("q")
+
+    def __len__(self):
+        return len(self.side) - len(self._free)
+
+    def alloc(self, order_id: str, user: int, ticker: int, side: int, price: int, qty: int, filled: int) -> int:
+        raw = UUID(str(order_id)).bytes
+        if self._free:
+            handle = self._free.pop()
+            self.price[handle] = price
+            self.qty[handle] = qty
+            self.filled[handle] = filled
+            self.user[handle] = user
+            self.ticker[handle] = ticker
+            self.side[handle] = side
+            self.ids[handle * 16:handle * 16 + 16] = raw
+        else:
+            handle = len(self.side)
+            self.price.append(price)
+            self.qty.append(qty)
+            self.filled.append(filled)
+            self.user.append(user)
+            self.ticker.append(ticker)
+            self.side.append(side)
+            self.ids += raw
+        return handle
+
+    def release(self, handle: int) -> None:
+        self.side[handle] = -1
+        self._free.append(handle)
+
+    def live(self, handle: int) -> bool:
+        return self.side[handle] >= 0
+
+    def order_id(self, handle: int) -> str:
+        return str(UUID(bytes=bytes(self.ids[handle * 16:handle * 16 + 16])))
+
+    def free_qty(self, handle: int) -> int:
+        return self.qty[handle] - self.filled[handle]
+
+
+class TickerBook:
+    __slots__ = ("prices", "levels", "depth", "stops", "last_price", "auction")
+
+    def __init__(self):
+        # indexed by side; prices are kept ascending so the best bid is last and the best ask is first
+        self.prices: Tuple[List[int], List[int]] = ([], [])
+        self.levels: Tuple[Dict[int, deque], Dict[int, deque]] = ({}, {})
+        self.depth: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+        # pending stops as sorted (key, seq, order_id, user) entries; the key is the stop price for BUY
+        # and its negation for SELL, so the triggered entries are always a prefix
+        self.stops: Tuple[List[tuple], List[tuple]] = ([], [])
+        self.last_price: Optional[int] = None
+        # while collecting for a call auction orders rest without matching, so the book may cross
+        self.auction = False
+
+    def insert(self, side: int, price: int, handle: int, free_qty: int) -> None:
+        level = self.levels[side].get(price)
+        if level is None:
+            level = self.levels[side][price] = deque()
+            self.depth[side][price] = 0
+            bisect.insort(self.prices[side], price)
+        level.append(handle)
+        self.depth[side][price] += free_qty
+
+    def discard(self, side: int, price: int, handle: int, free_qty: int) -> None:
+        level = self.levels[side][price]
+        if level[0] == handle:
+            level.popleft()
+        else:
+            level.remove(handle)
+        self.depth[side][price] -= free_qty
+        if not level:
+            del self.levels[side][price]
+            del self.depth[side][price]
+            prices = self.prices[side]
+            del prices[bisect.bisect_left(prices, price)]
+
+    def crossing_prices(self, side: int, limit: Optional[int]) -> Iterable[int]:
+        # opposite side prices in priority order for an incoming order on `side`
+        if side == BUY:
+            prices = self.prices[SELL]
+            end = len(prices) if limit is None else bisect.bisect_right(prices, limit)
+            return (prices[i] for i in range(end))
+        prices = self.prices[BUY]
+        start = 0 if limit is None else bisect.bisect_left(prices, limit)
+        return (prices[i] for i in range(len(prices) - 1, start - 1, -1))
+
+    def top(self, side: int, limit: int) -> List[Tuple[int, int]]:
+        prices = self.prices[side]
+        ordered = prices[max(len(prices) - limit, 0):][::-1] if side == BUY else prices[:limit]
+        depth = self.depth[side]
+        return [(p, depth[p]) for p in ordered]
+
+
+def _stop_key(side: int, stop_price: int) -> int:
+    return stop_price if side == BUY else -stop_price
+
+
+class MatchingEngine:
+    __slots__ = ("orders", "users", "tickers", "books", "expiries", "_stop_seq")
+
+    def __init__(self):
+        self.orders = OrderArena()
+        self.users = Interner()
+        self.tickers = Interner()
+        self.books: Dict[str, TickerBook] = {}
+        # heap of (expires_at epoch seconds, order_id); entries of orders that ended earlier
+        # are dropped lazily by the caller when they come due
+        self.expiries: List[Tuple[float, str]] = []
+        self._stop_seq = 0
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def book(self, ticker: str) -> TickerBook:
+        book = self.books.get(ticker)
+        if book is None:
+            self.tickers.intern(ticker)
+            book = self.books[ticker] = TickerBook()
+        return book
+
+    def order_id(self, handle: int) -> str:
+        return self.orders.order_id(handle)
+
+    def add(self, order_id: str, user_id: str, ticker: str, direction: Direction,
+            price: int, qty: int, filled: int = 0) -> int:
+        book = self.book(ticker)
+        side = side_of(direction)
+        handle = self.orders.alloc(order_id, self.users.intern(str(user_id)), self.tickers.intern(ticker),
+                                   side, price, qty, filled)
+        book.insert(side, price, handle, qty - filled)
+        return handle
+
+    def load(self, orders) -> None:
+        for o in orders:
+            if o.expires_at is not None:
+                self.schedule_expiry(o.id, o.expires_at_aware.timestamp())
+            if o.stop_price is not None and not o.triggered:
+                self.add_stop(o.id, o.user_id, o.ticker, o.direction, o.stop_price)
+            elif o.price is not None and o.qty > o.filled:
+                self.add(o.id, o.user_id, o.ticker, o.direction, o.price, o.qty, o.filled)
+
+    def find(self, order_id: str, ticker: str, direction: Direction, price: int) -> Optional[int]:
+        book = self.books.get(ticker)
+        if book is None or price is None:
+            return None
+        level = book.levels[side_of(direction)].get(price)
+        if not level:
+            return None
+        raw = UUID(str(order_id)).bytes
+        ids = self.orders.ids
+        for handle in level:
+            if ids[handle * 16:handle * 16 + 16] == raw:
+                return handle
+        return None
+
+    def _unlink(self, handle: int) -> None:
+        orders = self.orders
+        book = self.books[self.tickers.values[orders.ticker[handle]]]
+        book.discard(orders.side[handle], orders.price[handle], handle, orders.free_qty(handle))
+        orders.release(handle)
+
+    def remove(self, order_id: str, ticker: str, direction: Direction, price: int) -> bool:
+        handle = self.find(order_id, ticker, direction, price)
+        if handle is None:
+            return False
+        self._unlink(handle)
+        return True
+
+    def match(self, ticker: str, direction: Direction, price: Optional[int], qty: int, user_id: Optional[str] = None,
+              stp: SelfTradePrevention = SelfTradePrevention.NONE) -> List[Tuple[int, int, int, int]]:
+        # Plans (handle, trade_price, qty, action) steps without touching the book, so a failed
+        # settlement leaves the engine untouched; apply the plan with apply() after commit.
+        book = self.books.get(ticker)
+        if book is None or qty <= 0:
+            return []
+        side = side_of(direction)
+        levels = book.levels[1 - side]
+        orders = self.orders
+        qtys, filled, users = orders.qty, orders.filled, orders.user
+        taker = None
+        if user_id is not None and stp != SelfTradePrevention.NONE:
+            taker = self.users.get(str(user_id))
+        plan = []
+        for level_price in book.crossing_prices(side, price):
+            for handle in levels[level_price]:
+                free = qtys[handle] - filled[handle]
+                if taker is not None and users[handle] == taker:
+                    if stp == SelfTradePrevention.CANCEL_OLDEST:
+                        plan.append((handle, level_price, free, STP_CANCEL))
+                        continue
+                    if stp == SelfTradePrevention.DECREMENT:
+                        take = min(qty, free)
+                        plan.append((handle, level_price, take, STP_DECREMENT))
+                        qty -= take
+                        if qty == 0:
+                            return plan
+                        continue
+                    if stp == SelfTradePrevention.CANCEL_BOTH:
+                        plan.append((handle, level_price, free, STP_CANCEL))
+                    plan.append((handle, level_price, 0, STP_STOP))
+                    return plan
+                take = min(qty, free)
+                plan.append((handle, level_price, take, FILL))
+                qty -= take
+                if qty == 0:
+                    return plan
+        return plan
+
+    def crosses(self, ticker: str, direction: Direction, price: Optional[int]) -> bool:
+        book = self.books.get(ticker)
+        if book is None:
+            return False
+        return next(iter(book.crossing_prices(side_of(direction), price)), None) is not None
+
+    def fillable(self, ticker: str, direction: Direction, price: Optional[int], qty: int, user_id: Optional[str] = None,
+                 stp: SelfTradePrevention = SelfTradePrevention.NONE) -> bool:
+        # answered from the cached level aggregates unless self-trade prevention applies: then the
+        # taker's own resting orders never fill it, they are either cancelled (CANCEL_OLDEST) or
+        # end the match early, so the levels are walked order by order like match() does
+        book = self.books.get(ticker)
+        if book is None:
+            return False
+        side = side_of(direction)
+        taker = None
+        if user_id is not None and stp != SelfTradePrevention.NONE:
+            taker = self.users.get(str(user_id))
+        if taker is None:
+            depth = book.depth[1 - side]
+            for level_price in book.crossing_prices(side, price):
+                qty -= depth[level_price]
+                if qty <= 0:
+                    return True
+            return False
+        levels = book.levels[1 - side]
+        orders = self.orders
+        for level_price in book.crossing_prices(side, price):
+            for handle in levels[level_price]:
+                if orders.user[handle] == taker:
+                    if stp == SelfTradePrevention.CANCEL_OLDEST:
+                        continue
+                    return False
+                qty -= orders.free_qty(handle)
+                if qty <= 0:
+                    return True
+        return False
+
+    def fill(self, handle: int, qty: int) -> None:
+        self.orders.filled[handle] += qty
+        self._shrink(handle, qty)
+
+    def decrement(self, handle: int, qty: int) -> None:
+        self.orders.qty[handle] -= qty
+        self._shrink(handle, qty)
+
+    def _shrink(self, handle: int, qty: int) -> None:
+        orders = self.orders
+        book = self.books[self.tickers.values[orders.ticker[handle]]]
+        side, price = orders.side[handle], orders.price[handle]
+        if orders.free_qty(handle) > 0:
+            book.depth[side][price] -= qty
+        else:
+            book.discard(side, price, handle, qty)
+            orders.release(handle)
+
+    def apply(self, plan: List[Tuple[int, int, int, int]]) -> None:
+        for handle, _, qty, action in plan:
+            if action == FILL:
+                self.fill(handle, qty)
+            elif action == STP_DECREMENT:
+                self.decrement(handle, qty)
+            elif action == STP_CANCEL:
+                self._unlink(handle)
+
+    def add_stop(self, order_id: str, user_id: str, ticker: str, direction: Direction, stop_price: int) -> None:
+        side = side_of(direction)
+        self._stop_seq += 1
+        entry = (_stop_key(side, stop_price), self._stop_seq, str(order_id), self.users.intern(str(user_id)))
+        bisect.insort(self.book(ticker).stops[side], entry)
+
+    def remove_stop(self, order_id: str, ticker: str, direction: Direction, stop_price: int) -> bool:
+        book = self.books.get(ticker)
+        if book is None:
+            return False
+        side = side_of(direction)
+        stops = book.stops[side]
+        key = _stop_key(side, stop_price)
+        for i in range(bisect.bisect_left(stops, (key,)), len(stops)):
+            if stops[i][0] != key:
+                break
+            if stops[i][2] == str(order_id):
+                del stops[i]
+                return True
+        return False
+
+    def stop_triggered(self, ticker: str, direction: Direction, stop_price: int) -> bool:
+        book = self.books.get(ticker)
+        if book is None or book.last_price is None:
+            return False
+        side = side_of(direction)
+        return _stop_key(side, stop_price) <= _stop_key(side, book.last_price)
+
+    def reservations(self, cash_ticker: str) -> Dict[str, int]:
+        # assets committed to resting orders, read from the cached level aggregates
+        reserved: Dict[str, int] = {}
+        for ticker, book in self.books.items():
+            bids, asks = book.depth
+            if asks:
+                reserved[ticker] = reserved.get(ticker, 0) + sum(asks.values())
+            if bids:
+                reserved[cash_ticker] = reserved.get(cash_ticker, 0) + sum(p * q for p, q in bids.items())
+        return reserved
+
+    def start_auction(self, ticker: str) -> None:
+        self.book(ticker).auction = True
+
+    def end_auction(self, ticker: str) -> None:
+        book = self.books.get(ticker)
+        if book is not None:
+            book.auction = False
+
+    def in_auction(self, ticker: str) -> bool:
+        book = self.books.get(ticker)
+        return book is not None and book.auction
+
+    def _auction_depth(self, book: TickerBook, excluded: Set[int]) -> Tuple[Dict[int, int], Dict[int, int]]:
+        if not excluded:
+            return book.depth
+        depth = (dict(book.depth[BUY]), dict(book.depth[SELL]))
+        orders = self.orders
+        for handle in excluded:
+            depth[orders.side[handle]][orders.price[handle]] -= orders.free_qty(handle)
+        return depth
+
+    def auction_price(self, ticker: str, excluded: Set[int] = frozenset()) -> Tuple[Optional[int], int]:
+        # The uncrossing price executes the most volume; ties go to the smallest surplus, then to the
+        # price closest to the last trade, then to the lowest price. Returns (None, 0) if nothing crosses.
+        book = self.books.get(ticker)
+        if book is None:
+            return None, 0
+        bids, asks = self._auction_depth(book, excluded)
+        buy_left, sell_below = sum(bids.values()), 0
+        best, best_key = None, None
+        for price in sorted(set(bids) | set(asks)):
+            sell_below += asks.get(price, 0)
+            volume = min(buy_left, sell_below)
+            if volume > 0:
+                key = (volume, -abs(buy_left - sell_below),
+                       -abs(price - book.last_price) if book.last_price is not None else 0)
+                if best_key is None or key > best_key:
+                    best, best_key = price, key
+            buy_left -= bids.get(price, 0)
+        return (best, best_key[0]) if best is not None else (None, 0)
+
+    def uncross(self, ticker: str, excluded: Set[int] = frozenset()) -> Tuple[Optional[int], List[Tuple[int, int, int]]]:
+        # Plans (buy handle, sell handle, qty) fills at the uncrossing price, each side in price-time
+        # priority, without touching the book; apply them with apply_auction() after commit.
+        price, volume = self.auction_price(ticker, excluded)
+        if price is None:
+            return None, []
+        book = self.books[ticker]
+        orders = self.orders
+
+        def queue(side: int):
+            for level_price in book.crossing_prices(1 - side, price):
+                for handle in book.levels[side][level_price]:
+                    if handle not in excluded:
+                        yield handle, orders.free_qty(handle)
+
+        bids, asks = queue(BUY), queue(SELL)
+        plan = []
+        (bid, bid_free), (ask, ask_free) = next(bids), next(asks)
+        while True:
+            take = min(bid_free, ask_free, volume)
+            plan.append((bid, ask, take))
+            volume -= take
+            if volume == 0:
+                return price, plan
+            bid_free -= take
+            ask_free -= take
+            if bid_free == 0:
+                bid, bid_free = next(bids)
+            if ask_free == 0:
+                ask, ask_free = next(asks)
+
+    def apply_auction(self, plan: List[Tuple[int, int, int]]) -> None:
+        for bid, ask, qty in plan:
+            self.fill(bid, qty)
+            self.fill(ask, qty)
+
+    def set_last_price(self, ticker: str, price: int) -> None:
+        self.book(ticker).last_price = price
+
+    def last_prices(self) -> Dict[str, int]:
+        return {ticker: book.last_price for ticker, book in self.books.items() if book.last_price is not None}
+
+    def trigger(self, ticker: str, trade_prices: Iterable[int]) -> List[str]:
+        # records each trade price as the last price and pops the stops it fires, BUY stops
+        # before SELL stops and each side in (stop price, arrival) order
+        book = self.books.get(ticker)
+        if book is None:
+            return []
+        fired = []
+        for price in trade_prices:
+            book.last_price = price
+            for side in (BUY, SELL):
+                stops = book.stops[side]
+                cut = bisect.bisect_right(stops, (_stop_key(side, price), math.inf))
+                if cut:
+                    fired.extend(entry[2] for entry in stops[:cut])
+                    del stops[:cut]
+        return fired
+
+    def schedule_expiry(self, order_id: str, expires_at: float) -> None:
+        heapq.heappush(self.expiries, (expires_at, str(order_id)))
+
+    def next_expiry(self) -> Optional[float]:
+        return self.expiries[0][0] if self.expiries else None
+
+    def due_expiries(self, now: float) -> List[str]:
+        # walks the heap without popping, so the entries survive a failed commit; drop them with
+        # pop_expiries() once the expiry is committed
+        heap = self.expiries
+        due = []
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i < len(heap) and heap[i][0] <= now:
+                due.append(heap[i])
+                stack.extend((2 * i + 1, 2 * i + 2))
+        due.sort()
+        return [order_id for _, order_id in due]
+
+    def pop_expiries(self, now: float) -> None:
+        while self.expiries and self.expiries[0][0] <= now:
+            heapq.heappop(self.expiries)
+
+    def levels(self, ticker: str, direction: Direction, limit: int) -> List[Dict[str, int]]:
+        book = self.books.get(ticker)
+        if book is None:
+            return []
+        return [{"price": p, "qty": q} for p, q in book.top(side_of(direction), limit)]
+
+    def drop_ticker(self, ticker: str) -> int:
+        book = self.books.pop(ticker, None)
+        if book is None:
+            return 0
+        count = 0
+        for levels in book.levels:
+            for level in levels.values():
+                for handle in level:
+                    self.orders.release(handle)
+                    count += 1
+        return count
+
+    def drop_user(self, user_id: str) -> int:
+        user = self.users.get(str(user_id))
+        if user is None:
+            return 0
+        orders = self.orders
+        handles = [h for h in range(len(orders.side)) if orders.side[h] >= 0 and orders.user[h] == user]
+        for handle in handles:
+            self._unlink(handle)
+        for book in self.books.values():
+            for stops in book.stops:
+                stops[:] = [entry for entry in stops if entry[3] != user]
+        return len(handles)
+
+
+matching_engine = MatchingEngine()
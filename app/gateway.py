@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import struct
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+from uuid import UUID
+
+
+logger = logging.getLogger(__name__)
+
+# Every message is a one-byte type followed by a fixed-layout little-endian body; strings are
+# NUL-padded, order ids are raw 16-byte UUIDs and a zero price means a market order.
+LOGON = b"L"
+NEW_ORDER = b"N"
+CANCEL = b"C"
+REPLACE = b"R"
+LOGON_ACK = b"A"
+EXEC_REPORT = b"E"
+REJECT = b"J"
+
+INBOUND = {
+    LOGON: struct.Struct("<64s"),                  # api key
+    NEW_ORDER: struct.Struct("<Q10sBIIBBBI"),      # seq, ticker, side, price, qty, tif, post only, stp, stop price
+    CANCEL: struct.Struct("<Q16s"),                # seq, order id
+    REPLACE: struct.Struct("<Q16sII"),             # seq, order id, price, total qty including fills
+}
+OUTBOUND = {
+    LOGON_ACK: struct.Struct("<B16s"),             # accepted, user id
+    EXEC_REPORT: struct.Struct("<Q16sBIII"),       # seq (0 if unsolicited), order id, status, qty, filled, price
+    REJECT: struct.Struct("<Q16sH48s"),            # seq, order id, code, reason
+}
+DEFAULT = 255
+
+# (order id, status index, qty, filled, price)
+OrderState = Tuple[str, int, int, int, int]
+
+
+def pack(msg_type: bytes, *fields) -> bytes:
+    return msg_type + (INBOUND.get(msg_type) or OUTBOUND[msg_type]).pack(*fields)
+
+
+def _text(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode()
+
+
+class GatewayError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _reject_reason(e: Exception) -> Tuple[int, str]:
+    detail = getattr(e, "detail", None)
+    if isinstance(detail, dict):
+        detail = detail["detail"][0]["msg"]
+    return getattr(e, "status_code", 500), str(detail if detail is not None else e)
+
+
+class GatewaySession:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.user_id: Optional[str] = None
+        self.api_key: Optional[str] = None
+        self.orders: Set[str] = set()
+
+    def send(self, msg_type: bytes, *fields) -> None:
+        self.writer.write(pack(msg_type, *fields))
+
+    def report(self, seq: int, state: OrderState) -> None:
+        order_id, status, qty, filled, price = state
+        self.send(EXEC_REPORT, seq, UUID(order_id).bytes, status, qty, filled, price)
+
+    def reject(self, seq: int, order_id: bytes, e: Exception) -> None:
+        code, reason = _reject_reason(e)
+        self.send(REJECT, seq, order_id, code, reason.encode()[:48])
+
+
+class OrderGateway:
+    # Persistent binary order entry sharing the matching path with the HTTP API. Callbacks:
+    # logon(api_key) -> user id or None; allow(user_id) -> bool; submit(user_id, fields) and
+    # replace(user_id, order_id, price, qty) -> OrderState; cancel(user_id, order_id) -> OrderState;
+    # states(order_ids) -> [OrderState]. Errors raised by callbacks are sent back as rejects.
+    def __init__(self, logon: Callable, allow: Callable, submit: Callable, cancel: Callable,
+                 replace: Callable, states: Callable, terminal: Iterable[int]):
+        self.logon = logon
+        self.allow = allow
+        self.submit = submit
+        self.cancel = cancel
+        self.replace = replace
+        self.states = states
+        self.terminal = set(terminal)
+        self.owners: Dict[str, GatewaySession] = {}
+        self.changed: Set[str] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int) -> None:
+        self.server = await asyncio.start_server(self._serve, host, port)
+        logger.info(f"Order gateway listening on {host}:{port}")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.owners.clear()
+        self.changed.clear()
+
+    def order_changed(self, order_id: str) -> None:
+        # called after commit for every order the engine touched; reports go out in one batch
+        if order_id in self.owners:
+            if not self.changed:
+                asyncio.get_running_loop().call_soon(self._flush)
+            self.changed.add(order_id)
+
+    def _flush(self) -> None:
+        order_ids, self.changed = list(self.changed), set()
+        try:
+            states = self.states(order_ids)
+        except Exception:
+            logger.exception("Gateway could not load order states for execution reports")
+            return
+        for state in states:
+            self._track(state, self.owners.get(state[0]))
+
+    def _track(self, state: OrderState, session: Optional[GatewaySession], seq: int = 0) -> None:
+        if session is None:
+            return
+        session.report(seq, state)
+        order_id = state[0]
+        if state[1] in self.terminal:
+            self.owners.pop(order_id, None)
+            session.orders.discard(order_id)
+        else:
+            self.owners[order_id] = session
+            session.orders.add(order_id)
+
+    def _untrack(self, session: GatewaySession, order_id: str) -> None:
+        self.owners.pop(order_id, None)
+        session.orders.discard(order_id)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = GatewaySession(writer)
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                msg_type = await reader.read(1)
+                if not msg_type:
+                    break
+                layout = INBOUND.get(msg_type)
+                if layout is None:
+                    logger.warning(f"Gateway session {peer} sent unknown message type {msg_type!r}")
+                    break
+                fields = layout.unpack(await reader.readexactly(layout.size))
+                if not self._handle(session, msg_type, fields):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for order_id in session.orders:
+                self.owners.pop(order_id, None)
+            writer.close()
+            logger.info(f"Gateway session {peer} of user {session.user_id} closed")
+
+    def _handle(self, session: GatewaySession, msg_type: bytes, fields: tuple) -> bool:
+        if msg_type == LOGON:
+            api_key = _text(fields[0])
+            user_id = self.logon(api_key)
+            session.send(LOGON_ACK, user_id is not None, UUID(user_id).bytes if user_id else bytes(16))
+            if user_id is None:
+                logger.warning("Gateway logon rejected")
+                return False
+            session.user_id, session.api_key = user_id, api_key
+            logger.info(f"Gateway logon of user {user_id}")
+            return True
+        seq = fields[0]
+        order_id = fields[1] if msg_type in (CANCEL, REPLACE) else bytes(16)
+        if session.user_id is None:
+            session.reject(seq, order_id, GatewayError(401, "Logon required"))
+            return False
+        if not self.allow(session.user_id):
+            session.reject(seq, order_id, GatewayError(429, "Too many requests"))
+            return True
+        target, tracked = None, False
+        try:
+            if msg_type == NEW_ORDER:
+                state = self.submit(session.user_id, (_text(fields[1]),) + fields[2:])
+            else:
+                target = str(UUID(bytes=order_id))
+                tracked = target in session.orders
+                # the ack below reports the result, so no unsolicited report for the same change
+                self._untrack(session, target)
+                if msg_type == CANCEL:
+                    state = self.cancel(session.user_id, target)
+                else:
+                    state = self.replace(session.user_id, target, fields[2], fields[3])
+        except Exception as e:
+            session.reject(seq, order_id, e)
+            if tracked:
+                # a failed replace may still have cancelled the original, so report where it stands
+                self.owners[target] = session
+                session.orders.add(target)
+                self.order_changed(target)
+            return True
+        self._track(state, session, seq)
+        return True
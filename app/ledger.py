@@ -0,0 +1,41 @@
+from collections import defaultdict
+from typing import Dict
+
+
+class Ledger:
+    # Running per-ticker totals of every flow that changes the amount of an asset held on the
+    # exchange; trades only move assets between users, so they never touch these totals.
+    def __init__(self):
+        self.opening: Dict[str, int] = defaultdict(int)
+        self.deposited: Dict[str, int] = defaultdict(int)
+        self.withdrawn: Dict[str, int] = defaultdict(int)
+        self.written_off: Dict[str, int] = defaultdict(int)
+        self.version = 0
+
+    def seed(self, totals: Dict[str, int]) -> None:
+        self.__init__()
+        self.opening.update(totals)
+
+    def deposit(self, ticker: str, amount: int) -> None:
+        self.deposited[ticker] += amount
+        self.version += 1
+
+    def withdraw(self, ticker: str, amount: int) -> None:
+        self.withdrawn[ticker] += amount
+        self.version += 1
+
+    def write_off(self, ticker: str, amount: int) -> None:
+        self.written_off[ticker] += amount
+        self.version += 1
+
+    def drop_ticker(self, ticker: str) -> None:
+        for totals in (self.opening, self.deposited, self.withdrawn, self.written_off):
+            totals.pop(ticker, None)
+        self.version += 1
+
+    def tickers(self):
+        return set(self.opening) | set(self.deposited) | set(self.withdrawn) | set(self.written_off)
+
+    def expected(self, ticker: str) -> int:
+        return self.opening.get(ticker, 0) + self.deposited.get(ticker, 0) \
+            - self.withdrawn.get(ticker, 0) - self.written_off.get(ticker, 0)
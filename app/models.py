@@ -23,6 +23,38 @@ class OrderStatus(str, Enum):
    CANCELLED = "CANCELLED"
 
 
+class TimeInForce(str, Enum):
+   GTC = "GTC"
+   IOC = "IOC"
+   FOK = "FOK"
+   GTD = "GTD"
+   DAY = "DAY"
+
+
+class SelfTradePrevention(str, Enum):
+   NONE = "NONE"
+   CANCEL_NEWEST = "CANCEL_NEWEST"
+   CANCEL_OLDEST = "CANCEL_OLDEST"
+   CANCEL_BOTH = "CANCEL_BOTH"
+   DECREMENT = "DECREMENT"
+
+
+class ExportKind(str, Enum):
+   TRADES = "trades"
+   ORDERS = "orders"
+   BALANCES = "balances"
+
+
+class ExportFormat(str, Enum):
+   NDJSON = "ndjson"
+   CSV = "csv"
+
+
+class TradingPhase(str, Enum):
+   CONTINUOUS = "CONTINUOUS"
+   AUCTION = "AUCTION"
+
+
 class Body_deposit_api_v1_admin_balance_deposit_post(BaseModel):
    user_id: UUID = Field(
       ...,
@@ -59,6 +91,22 @@ class Body_withdraw_api_v1_admin_balance_withdraw_post(BaseModel):
    )
 
 
+class BulkRowResult(BaseModel):
+   index: int = Field(..., title="Index")
+   success: bool = Field(..., title="Success")
+   error: Optional[str] = Field(None, title="Error")
+
+
+class PurgeStatus(BaseModel):
+   id: UUID = Field(..., title="Id")
+   target: str = Field(..., title="Target")
+   deleted: Dict[str, int] = Field(..., title="Deleted")
+   done: bool = Field(..., title="Done")
+   error: Optional[str] = Field(None, title="Error")
+   started_at: datetime = Field(..., title="Started At")
+   finished_at: Optional[datetime] = Field(None, title="Finished At")
+
+
 class CreateOrderResponse(BaseModel):
    success: Literal[True] = Field(True, title="Success")
    order_id: UUID = Field(..., title="Order Id", json_schema_extra={"format": "uuid4"})
@@ -84,6 +132,20 @@ class LimitOrderBody(BaseModel):
    ticker: str = Field(..., title="Ticker")
    qty: int = Field(..., ge=1, title="Qty")
    price: int = Field(..., gt=0, title="Price")
+   time_in_force: TimeInForce = Field(TimeInForce.GTC, title="Time In Force")
+   post_only: bool = Field(False, title="Post Only")
+   stop_price: Optional[int] = Field(None, gt=0, title="Stop Price")
+   expires_at: Optional[datetime] = Field(None, title="Expires At")
+   self_trade_prevention: Optional[SelfTradePrevention] = Field(
+      None, title="Self Trade Prevention",
+      description="Omitted means NONE: the order may trade against the same user's resting orders"
+   )
+   client_order_id: Optional[constr(min_length=1, max_length=64)] = Field(None, title="Client Order Id")
+   @field_validator('expires_at')
+   def ensure_expiry_utc(cls, v):
+      if v is None or v.tzinfo is None:
+         return v if v is None else v.replace(tzinfo=timezone.utc)
+      return v.astimezone(timezone.utc)
 
 
 class LimitOrder(BaseModel):
@@ -104,6 +166,18 @@ class MarketOrderBody(BaseModel):
    direction: Direction
    ticker: str = Field(..., title="Ticker")
    qty: int = Field(..., ge=1, title="Qty")
+   time_in_force: TimeInForce = Field(TimeInForce.IOC, title="Time In Force")
+   stop_price: Optional[int] = Field(None, gt=0, title="Stop Price")
+   self_trade_prevention: Optional[SelfTradePrevention] = Field(
+      None, title="Self Trade Prevention",
+      description="Omitted means NONE: the order may trade against the same user's resting orders"
+   )
+   client_order_id: Optional[constr(min_length=1, max_length=64)] = Field(None, title="Client Order Id")
+   @field_validator('time_in_force')
+   def ensure_not_resting(cls, v):
+      if v not in (TimeInForce.IOC, TimeInForce.FOK):
+         raise ValueError("Market orders cannot rest on the book")
+      return v
 
 
 class MarketOrder(BaseModel):
@@ -147,6 +221,46 @@ class ValidationError(BaseModel):
    type: str = Field(..., title = 'Error Type')
 
 
+class Valuation(BaseModel):
+   user_id: UUID = Field(..., title="User Id")
+   total: int = Field(..., title="Total")
+   positions: Optional[Dict[str, int]] = Field(None, title="Positions")
+
+
+class AuctionState(BaseModel):
+   ticker: str = Field(..., title="Ticker")
+   phase: TradingPhase
+   indicative_price: Optional[int] = Field(None, title="Indicative Price")
+   indicative_volume: int = Field(0, title="Indicative Volume")
+
+
+class AuctionResult(BaseModel):
+   ticker: str = Field(..., title="Ticker")
+   price: Optional[int] = Field(None, title="Price")
+   volume: int = Field(0, title="Volume")
+   trades: int = Field(0, title="Trades")
+   cancelled: int = Field(0, title="Cancelled")
+
+
+class LedgerTicker(BaseModel):
+   ticker: str = Field(..., title="Ticker")
+   opening: int = Field(..., title="Opening")
+   deposited: int = Field(..., title="Deposited")
+   withdrawn: int = Field(..., title="Withdrawn")
+   written_off: int = Field(..., title="Written Off")
+   expected: int = Field(..., title="Expected")
+   actual: int = Field(..., title="Actual")
+   reserved: int = Field(..., title="Reserved")
+   drift: int = Field(..., title="Drift")
+
+
+class ReconciliationReport(BaseModel):
+   checked_at: datetime = Field(..., title="Checked At")
+   settled: bool = Field(..., title="Settled")
+   consistent: bool = Field(..., title="Consistent")
+   tickers: List[LedgerTicker] = Field(default_factory=list, title="Tickers")
+
+
 class HTTPValidationError(BaseModel):
    detail: List[ValidationError] = Field(
       default_factory=list,
@@ -1,11 +1,12 @@
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Enum, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Enum, DateTime, ForeignKey, CheckConstraint, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
+from typing import Optional
 from datetime import datetime
-from models import UserRole, Direction, OrderStatus
+from models import UserRole, Direction, OrderStatus, TimeInForce, SelfTradePrevention
 
 
 Base = declarative_base()
@@ -41,8 +42,21 @@ class Order_BD(Base):
         nullable=False,
     )
     filled = Column(Integer, default=0)
+    time_in_force = Column(Enum(TimeInForce), nullable=False, default=TimeInForce.GTC)
+    post_only = Column(Boolean, nullable=False, default=False)
+    stop_price = Column(Integer)
+    triggered = Column(Boolean, nullable=False, default=False)
+    expires_at = Column(DateTime(timezone=True))
+    self_trade_prevention = Column(Enum(SelfTradePrevention), nullable=False, default=SelfTradePrevention.NONE)
+    client_order_id = Column(String)
     user = relationship("User_BD", back_populates="orders")
 
+    __table_args__ = (
+        # also serves lookups and purges by user_id alone through its leading column
+        Index("ux_orders_user_client_order_id", "user_id", "client_order_id", unique=True),
+        Index("ix_orders_ticker", "ticker"),
+    )
+
     @property
     def timestamp_aware(self) -> datetime:
         ts = self.timestamp
@@ -56,6 +70,13 @@ class Order_BD(Base):
 
         return ts
 
+    @property
+    def expires_at_aware(self) -> Optional[datetime]:
+        ts = self.expires_at
+        if ts is not None and ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts
+
 class Balance_BD(Base):
     __tablename__ = "balances"
     user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
@@ -64,6 +85,7 @@ class Balance_BD(Base):
     user = relationship("User_BD", back_populates="balances")
     __table_args__ = (
         CheckConstraint('amount >= 0', name='ck_balance_non_negative'),
+        Index("ix_balances_ticker", "ticker"),
     )
 
 class Transaction_BD(Base):
@@ -77,6 +99,9 @@ class Transaction_BD(Base):
         server_default=func.now(),
         nullable=False,
     )
+    __table_args__ = (
+        Index("ix_transactions_ticker_timestamp", "ticker", "timestamp"),
+    )
 
     @property
     def timestamp_aware(self) -> datetime:      # тот же приём
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+from sqlalchemy import delete, select, literal_column
+
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeJob:
+    def __init__(self, target: str, steps: List[Tuple[str, type, object]]):
+        self.id = str(uuid4())
+        self.target = target
+        self.steps = steps
+        self.deleted: Dict[str, int] = {name: 0 for name, _, _ in steps}
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+
+class Purger:
+    # Deletes rows in bounded chunks, one short transaction per chunk, yielding to the
+    # event loop in between so matching never waits behind a long-held write lock.
+    def __init__(self, session_factory, chunk_size: int = 1000, pause: float = 0.0, history: int = 100):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.history = history
+        self.jobs: Dict[str, PurgeJob] = {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def submit(self, target: str, steps: List[Tuple[str, type, object]]) -> PurgeJob:
+        job = PurgeJob(target, steps)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history:
+            finished = next((j for j in self.jobs.values() if j.done), None)
+            if finished is None:
+                break
+            del self.jobs[finished.id]
+        self.queue.put_nowait(job)
+        logger.info(f"Queued purge {job.id} of {target}")
+        return job
+
+    def active(self, target: str) -> bool:
+        return any(j.target == target and not j.done for j in self.jobs.values())
+
+    def active_targets(self, kind: str) -> List[str]:
+        prefix = kind + ":"
+        return [j.target[len(prefix):] for j in self.jobs.values() if j.target.startswith(prefix) and not j.done]
+
+    def _delete_chunk(self, model, criterion) -> int:
+        table = model.__table__
+        rowid = literal_column("rowid")
+        chunk = select(rowid).select_from(table).where(criterion).limit(self.chunk_size)
+        db = self.session_factory()
+        try:
+            deleted = db.execute(delete(table).where(rowid.in_(chunk))).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    async def _run_job(self, job: PurgeJob) -> None:
+        for name, model, criterion in job.steps:
+            while True:
+                deleted = self._delete_chunk(model, criterion)
+                job.deleted[name] += deleted
+                await asyncio.sleep(self.pause)
+                if deleted < self.chunk_size:
+                    break
+
+    async def run(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run_job(job)
+                logger.info(f"Purge {job.id} of {job.target} finished: {job.deleted}")
+            except Exception as e:
+                logger.exception(f"Purge {job.id} of {job.target} failed")
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.now(timezone.utc)
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Tuple
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(1 - self.tokens, 0) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_buckets: int = 100000):
+        # limits maps an endpoint class to (tokens per second, burst); past max_buckets the least
+        # recently used bucket is dropped, so memory stays bounded however many clients show up
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def allow(self, client: str, endpoint_class: str) -> Tuple[bool, float]:
+        now = monotonic()
+        key = (client, endpoint_class)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self.buckets.popitem(last=False)
+            rate, burst = self.limits[endpoint_class]
+            bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+        else:
+            self.buckets.move_to_end(key)
+        if bucket.take(now):
+            return True, 0.0
+        return False, bucket.retry_after()
+
+
+class AdmissionGate:
+    def __init__(self, max_depth: int):
+        self.max_depth = max_depth
+        self.depth = 0
+        self.shed = 0
+
+    def enter(self) -> bool:
+        if self.depth >= self.max_depth:
+            self.shed += 1
+            return False
+        self.depth += 1
+        return True
+
+    def leave(self) -> None:
+        self.depth -= 1
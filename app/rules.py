@@ -0,0 +1,215 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, time, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from engine import MatchingEngine, FILL, STP_CANCEL, STP_DECREMENT, STP_STOP
+from models import Direction, OrderStatus, TimeInForce, SelfTradePrevention
+from valuation import CASH_TICKER
+
+
+# Order acceptance, matching outcome and settlement rules shared by the API (main.py) and the
+# offline simulator. They work on anything with the Order_BD attributes and leave persistence,
+# commits and notifications to the caller.
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = (OrderStatus.EXECUTED, OrderStatus.CANCELLED)
+
+
+class Rejected(Exception):
+    # loc names the offending field; without it the API answers with a plain string detail
+    def __init__(self, status_code: int, msg: str, loc: Optional[str] = None):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.msg = msg
+        self.loc = loc
+
+
+def order_expiry(time_in_force: TimeInForce, expires_at: Optional[datetime], now: datetime) -> Optional[datetime]:
+    if time_in_force == TimeInForce.DAY:
+        return datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    if (time_in_force == TimeInForce.GTD) != (expires_at is not None):
+        raise Rejected(400, "expires_at is required for GTD orders only", "expires_at")
+    if expires_at is not None and expires_at <= now:
+        raise Rejected(400, "Order is already expired", "expires_at")
+    return expires_at
+
+
+def accept(engine: MatchingEngine, user_id: str, ticker: str, direction: Direction, price: Optional[int], qty: int,
+           time_in_force: TimeInForce, post_only: bool, stop_price: Optional[int],
+           stp: SelfTradePrevention) -> Tuple[bool, bool]:
+    # returns (pending stop, resting in the auction); only an order that trades now is checked
+    # against the book
+    auction = engine.in_auction(ticker)
+    if auction and (price is None or time_in_force in (TimeInForce.IOC, TimeInForce.FOK)):
+        raise Rejected(400, "Only resting limit orders are accepted during the auction", "time_in_force")
+    pending_stop = stop_price is not None and not engine.stop_triggered(ticker, direction, stop_price)
+    if pending_stop or auction:
+        return pending_stop, auction
+    if post_only and engine.crosses(ticker, direction, price):
+        raise Rejected(400, "Post-only order would cross the book", "post_only")
+    if time_in_force == TimeInForce.FOK and not engine.fillable(ticker, direction, price, qty, user_id, stp):
+        raise Rejected(400, "Order cannot be filled entirely", "time_in_force")
+    return pending_stop, auction
+
+
+def check_funds(engine: MatchingEngine, balances: Dict[str, int], ticker: str, direction: Direction,
+                price: Optional[int], qty: int, pending_stop: bool) -> None:
+    # balances are the user's amounts by ticker; a market buy is priced against the asks it would take
+    if direction == Direction.SELL:
+        if balances.get(ticker, 0) < qty:
+            raise Rejected(409, f"Insufficient {ticker} balance")
+        return
+    rub = balances.get(CASH_TICKER, 0)
+    if price is not None:
+        if rub < qty * price:
+            raise Rejected(409, "Insufficient RUB balance")
+        return
+    if pending_stop:
+        return
+    asks = engine.match(ticker, Direction.BUY, None, qty)
+    cost, need = 0, qty
+    for _, ask_price, take, _ in asks:
+        cost += take * ask_price
+        need -= take
+    if not asks or need > 0:
+        raise Rejected(400, "Not enough liquidity to execute market BUY")
+    if rub < cost:
+        raise Rejected(409, "Insufficient RUB balance")
+
+
+def trigger_blocked(engine: MatchingEngine, stop_order) -> bool:
+    # a triggered stop is held to the same post-only and FOK conditions as a new order
+    ticker, direction, price = stop_order.ticker, stop_order.direction, stop_order.price
+    if stop_order.post_only and engine.crosses(ticker, direction, price):
+        return True
+    return stop_order.time_in_force == TimeInForce.FOK and not engine.fillable(
+        ticker, direction, price, stop_order.qty - stop_order.filled, stop_order.user_id,
+        stop_order.self_trade_prevention)
+
+
+def settlement_legs(new_order, match_order, qty: int, price: int) -> List[Tuple[str, str, int]]:
+    # (user id, ticker, amount) in the order they are applied; any leg going negative fails the order
+    notional = qty * price
+    if new_order.direction == Direction.BUY:
+        return [(new_order.user_id, new_order.ticker, qty), (new_order.user_id, CASH_TICKER, -notional),
+                (match_order.user_id, CASH_TICKER, notional), (match_order.user_id, new_order.ticker, -qty)]
+    return [(new_order.user_id, CASH_TICKER, notional), (new_order.user_id, new_order.ticker, -qty),
+            (match_order.user_id, new_order.ticker, qty), (match_order.user_id, CASH_TICKER, -notional)]
+
+
+def apply_leg(current: Optional[int], ticker: str, amount: int) -> int:
+    # current is None while the user holds no balance row for the ticker yet
+    new_amount = (current or 0) + amount
+    if new_amount < 0:
+        raise Rejected(425 if current is None else 426, f"Insufficient {ticker} balance", "amount")
+    return new_amount
+
+
+def planned_trades(fills: list, matched: list) -> Iterable[Tuple[object, int, int]]:
+    # (resting order, qty, price) of the plan steps that trade
+    for (_, price, qty, action), match_order in zip(fills, matched):
+        if action == STP_STOP:
+            return
+        if action == FILL:
+            yield match_order, qty, price
+
+
+def _fill_status(order) -> OrderStatus:
+    return OrderStatus.EXECUTED if order.filled == order.qty else OrderStatus.PARTIALLY_EXECUTED
+
+
+def apply_match(new_order, fills: list, matched: list) -> Tuple[List[Tuple[object, int, int]], list, int]:
+    # Applies a match() plan to the incoming order and the resting orders it met (matched, one per
+    # step). Returns the trades as (resting order, qty, price), the resting orders changed and the
+    # incoming order's remaining qty; an unfilled remainder that may not rest is cancelled.
+    remaining_qty = new_order.qty - new_order.filled
+    trades, touched = [], []
+    self_trade_stop = False
+    for (_, trade_price, matched_qty, action), match_order in zip(fills, matched):
+        if action == STP_STOP:
+            logger.info(f"Self-trade prevention stops order {new_order.id} at resting order {match_order.id}")
+            self_trade_stop = True
+            break
+        touched.append(match_order)
+        if action == STP_CANCEL:
+            logger.info(f"Self-trade prevention cancels resting order {match_order.id}")
+            match_order.status = OrderStatus.CANCELLED
+            continue
+        if action == STP_DECREMENT:
+            logger.info(f"Self-trade prevention decrements orders {new_order.id} and {match_order.id} by {matched_qty}")
+            for o in (new_order, match_order):
+                if o.qty - matched_qty > o.filled:
+                    o.qty -= matched_qty
+                elif o.filled:
+                    o.qty, o.status = o.filled, OrderStatus.EXECUTED
+                else:
+                    o.status = OrderStatus.CANCELLED
+            remaining_qty -= matched_qty
+            continue
+        new_order.filled += matched_qty
+        match_order.filled += matched_qty
+        new_order.status = _fill_status(new_order)
+        match_order.status = _fill_status(match_order)
+        trades.append((match_order, matched_qty, trade_price))
+        remaining_qty -= matched_qty
+
+    if remaining_qty > 0 and (self_trade_stop or new_order.price is None or
+                              new_order.time_in_force in (TimeInForce.IOC, TimeInForce.FOK)):
+        logger.info(f"Cancelling unfilled remainder {remaining_qty} of {new_order.time_in_force} order {new_order.id}")
+        new_order.status = OrderStatus.CANCELLED
+    return trades, touched, remaining_qty
+
+
+def rests(new_order, remaining_qty: int) -> bool:
+    return new_order.status != OrderStatus.CANCELLED and new_order.price is not None and remaining_qty > 0
+
+
+def check_cancel(order) -> bool:
+    # returns whether the order is a stop still waiting for its trigger
+    pending_stop = order.stop_price is not None and not order.triggered
+    if order.price is None and not pending_stop:
+        raise Rejected(416, "Cannot cancel market order", "amount")
+    if order.status in TERMINAL_STATUSES:
+        raise Rejected(415, "annot cancel executed, partially executed or cancelled order", "amount")
+    return pending_stop
+
+
+def unbook(engine: MatchingEngine, order) -> None:
+    # takes a cancelled or expired order off the book or out of the stop index
+    if order.stop_price is not None and not order.triggered:
+        engine.remove_stop(order.id, order.ticker, order.direction, order.stop_price)
+    else:
+        engine.remove(order.id, order.ticker, order.direction, order.price)
+
+
+def uncross(engine: MatchingEngine, ticker: str, owners: Callable[[Set[int]], Dict[int, str]],
+            balances: Callable[[Set[str]], Dict[Tuple[str, str], int]]):
+    # Orders are not pre-funded, so participants whose fills they cannot pay for drop out with their
+    # crossing orders and the price is recomputed without them. owners maps handles to user ids,
+    # balances loads (user id, ticker) amounts. Returns (price, fills, excluded handles, balance
+    # deltas, balances the deltas apply to).
+    excluded: Set[int] = set()
+    while True:
+        price, fills = engine.uncross(ticker, excluded)
+        users = owners({h for bid, ask, _ in fills for h in (bid, ask)})
+        deltas = defaultdict(int)
+        for bid, ask, qty in fills:
+            buyer, seller = users[bid], users[ask]
+            deltas[(buyer, ticker)] += qty
+            deltas[(buyer, CASH_TICKER)] -= qty * price
+            deltas[(seller, ticker)] -= qty
+            deltas[(seller, CASH_TICKER)] += qty * price
+        current = balances({u for u, _ in deltas})
+        short = {u for (u, t), delta in deltas.items() if current.get((u, t), 0) + delta < 0}
+        if not short:
+            return price, fills, excluded, deltas, current
+        logger.warning(f"Auction on {ticker}: users {sorted(short)} cannot settle at {price}, recomputing without them")
+        excluded.update(h for h, u in users.items() if u in short)
+
+
+def apply_auction_fills(fills: List[Tuple[int, int, int]], order_of: Callable[[int], object]) -> None:
+    for bid, ask, qty in fills:
+        for handle in (bid, ask):
+            order = order_of(handle)
+            order.filled += qty
+            order.status = _fill_status(order)
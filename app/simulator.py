@@ -0,0 +1,292 @@
+import json
+import sys
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+from engine import MatchingEngine
+from models import Direction, OrderStatus, TimeInForce, SelfTradePrevention
+import rules
+from rules import Rejected, TERMINAL_STATUSES
+from valuation import CASH_TICKER
+
+
+class SimOrder:
+    __slots__ = ("id", "user_id", "ticker", "direction", "qty", "price", "filled", "status", "time_in_force",
+                 "post_only", "stop_price", "triggered", "self_trade_prevention", "client_order_id")
+
+    def __init__(self, order_id, user_id, ticker, direction, qty, price, time_in_force, post_only, stop_price,
+                 triggered, self_trade_prevention, client_order_id=None):
+        self.id = order_id
+        self.user_id = user_id
+        self.ticker = ticker
+        self.direction = direction
+        self.qty = qty
+        self.price = price
+        self.filled = 0
+        self.status = OrderStatus.NEW
+        self.time_in_force = time_in_force
+        self.post_only = post_only
+        self.stop_price = stop_price
+        self.triggered = triggered
+        self.self_trade_prevention = self_trade_prevention
+        self.client_order_id = client_order_id
+
+
+def _utc(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    parsed = datetime.fromisoformat(value)
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+
+class Simulator:
+    # Replays order events through the same engine and the shared rules module used by
+    # create_order/execute_order/cancel_order/uncross_auction, holding orders and balances in dicts
+    # instead of the database. Events are dicts of type instrument, deposit, withdraw, order, cancel,
+    # auction (start a call auction) or uncross; an optional "ts" advances the simulated clock used
+    # for expiries.
+    def __init__(self, book_depth: int = 0,
+                 default_self_trade_prevention: SelfTradePrevention = SelfTradePrevention.NONE):
+        self.engine = MatchingEngine()
+        self.book_depth = book_depth
+        self.default_self_trade_prevention = default_self_trade_prevention
+        self.instruments = set()
+        self.balances: Dict[Tuple[str, str], int] = {}
+        self.orders: Dict[str, SimOrder] = {}
+        self.client_orders: Dict[Tuple[str, str], str] = {}
+        self.now: Optional[datetime] = None
+        self._seq = 0
+        self._out: List[dict] = []
+
+    def clock(self) -> datetime:
+        return self.now or datetime.now(timezone.utc)
+
+    def run(self, events: Iterable[dict]) -> Iterator[dict]:
+        for event in events:
+            yield from self.step(event)
+
+    def step(self, event: dict) -> List[dict]:
+        out = self._out = []
+        if event.get("ts") is not None:
+            self.now = _utc(event["ts"])
+        kind = event["type"]
+        handler = getattr(self, "_on_" + kind, None)
+        try:
+            if handler is None:
+                raise Rejected(422, f"Unknown event type {kind}")
+            self._expire()
+            out.append(dict(handler(event), type=kind))
+        except Rejected as e:
+            out.append({"type": "reject", "event": kind, "code": e.status_code, "msg": str(e)})
+        ticker = event.get("ticker")
+        if self.book_depth and ticker in self.engine.books:
+            out.append({
+                "type": "book",
+                "ticker": ticker,
+                "bid_levels": self.engine.levels(ticker, Direction.BUY, self.book_depth),
+                "ask_levels": self.engine.levels(ticker, Direction.SELL, self.book_depth),
+            })
+        return out
+
+    def _on_instrument(self, event: dict) -> dict:
+        ticker = event["ticker"]
+        if ticker in self.instruments:
+            raise Rejected(400, "Instrument already exists")
+        self.instruments.add(ticker)
+        return {"ticker": ticker}
+
+    def _check_ticker(self, ticker: str) -> None:
+        if ticker != CASH_TICKER and ticker not in self.instruments:
+            raise Rejected(404, "Instrument not found")
+
+    def _on_deposit(self, event: dict) -> dict:
+        key = (event["user_id"], event["ticker"])
+        self._check_ticker(key[1])
+        self.balances[key] = self.balances.get(key, 0) + event["amount"]
+        return {"user_id": key[0], "ticker": key[1], "amount": self.balances[key]}
+
+    def _on_withdraw(self, event: dict) -> dict:
+        key = (event["user_id"], event["ticker"])
+        self._check_ticker(key[1])
+        if self.balances.get(key, 0) < event["amount"]:
+            raise Rejected(400, "Insufficient balance")
+        self.balances[key] -= event["amount"]
+        return {"user_id": key[0], "ticker": key[1], "amount": self.balances[key]}
+
+    def _expire(self) -> None:
+        now = self.clock().timestamp()
+        due = self.engine.due_expiries(now)
+        self.engine.pop_expiries(now)
+        for order_id in due:
+            order = self.orders.get(order_id)
+            if order is None or order.status in TERMINAL_STATUSES:
+                continue
+            order.status = OrderStatus.CANCELLED
+            rules.unbook(self.engine, order)
+            self._out.append({"type": "expired", "order_id": order.id})
+
+    def _ack(self, order: SimOrder) -> dict:
+        return {"order_id": order.id, "status": order.status.value, "filled": order.filled}
+
+    def _on_order(self, event: dict) -> dict:
+        direction = Direction(event["direction"])
+        ticker, qty, price = event["ticker"], event["qty"], event.get("price")
+        user_id = event["user_id"]
+        stop_price = event.get("stop_price")
+        time_in_force = TimeInForce(event.get("time_in_force") or (TimeInForce.GTC if price is not None else TimeInForce.IOC))
+        post_only = bool(event.get("post_only", False)) and price is not None
+        stp = event.get("self_trade_prevention")
+        stp = SelfTradePrevention(stp) if stp else self.default_self_trade_prevention
+        client_order_id = event.get("client_order_id")
+        if qty < 1 or (price is not None and price <= 0) or (stop_price is not None and stop_price <= 0):
+            raise Rejected(422, "Qty and prices must be positive")
+        if price is None and time_in_force not in (TimeInForce.IOC, TimeInForce.FOK):
+            raise Rejected(422, "Market orders cannot rest on the book")
+        if client_order_id is not None and (user_id, client_order_id) in self.client_orders:
+            # a retry of an order that was already placed gets the original order back untouched
+            return self._ack(self.orders[self.client_orders[(user_id, client_order_id)]])
+        if ticker not in self.instruments:
+            raise Rejected(423, "Instrument not found", "ticker")
+
+        engine = self.engine
+        expires_at = rules.order_expiry(time_in_force, _utc(event.get("expires_at")) if price is not None else None,
+                                        self.clock())
+        pending_stop, auction = rules.accept(engine, user_id, ticker, direction, price, qty, time_in_force, post_only,
+                                             stop_price, stp)
+        rules.check_funds(engine, {t: self.balances.get((user_id, t), 0) for t in (CASH_TICKER, ticker)}, ticker,
+                          direction, price, qty, pending_stop)
+
+        order_id = event.get("order_id")
+        if order_id is None:
+            self._seq += 1
+            order_id = str(UUID(int=self._seq, version=4))
+        order = self.orders[order_id] = SimOrder(order_id, user_id, ticker, direction, qty, price, time_in_force,
+                                                 post_only, stop_price, stop_price is not None and not pending_stop, stp,
+                                                 client_order_id)
+        if expires_at is not None:
+            engine.schedule_expiry(order_id, expires_at.timestamp())
+        if pending_stop:
+            engine.add_stop(order_id, user_id, ticker, direction, stop_price)
+        elif auction:
+            engine.add(order_id, user_id, ticker, direction, price, qty)
+        else:
+            try:
+                trade_prices = self._match(order)
+            except Rejected:
+                del self.orders[order_id]
+                raise
+            self._trigger_stops(ticker, trade_prices)
+        if client_order_id is not None:
+            self.client_orders[(user_id, client_order_id)] = order_id
+        return self._ack(order)
+
+    def _on_cancel(self, event: dict) -> dict:
+        order = self.orders.get(event["order_id"])
+        if order is None or order.user_id != event["user_id"]:
+            raise Rejected(417, "Order not found")
+        rules.check_cancel(order)
+        order.status = OrderStatus.CANCELLED
+        rules.unbook(self.engine, order)
+        return self._ack(order)
+
+    def _on_auction(self, event: dict) -> dict:
+        ticker = event["ticker"]
+        if ticker not in self.instruments:
+            raise Rejected(404, "Instrument not found", "ticker")
+        self.engine.start_auction(ticker)
+        return {"ticker": ticker}
+
+    def _on_uncross(self, event: dict) -> dict:
+        ticker = event["ticker"]
+        engine = self.engine
+        if ticker not in self.instruments:
+            raise Rejected(404, "Instrument not found", "ticker")
+        if not engine.in_auction(ticker):
+            raise Rejected(400, "Instrument is not in an auction", "ticker")
+        price, fills, excluded, deltas, _ = rules.uncross(
+            engine, ticker,
+            lambda handles: {h: self.orders[engine.order_id(h)].user_id for h in handles},
+            lambda user_ids: {key: amount for key, amount in self.balances.items() if key[0] in user_ids})
+        cancelled = [self.orders[engine.order_id(h)] for h in excluded]
+        for order in cancelled:
+            order.status = OrderStatus.CANCELLED
+        rules.apply_auction_fills(fills, lambda handle: self.orders[engine.order_id(handle)])
+        for key, delta in deltas.items():
+            self.balances[key] = self.balances.get(key, 0) + delta
+        for bid, ask, qty in fills:
+            self._out.append({"type": "trade", "ticker": ticker, "qty": qty, "price": price,
+                              "bid_order_id": engine.order_id(bid), "ask_order_id": engine.order_id(ask)})
+        for order in cancelled:
+            engine.remove(order.id, order.ticker, order.direction, order.price)
+        engine.apply_auction(fills)
+        engine.end_auction(ticker)
+        if fills:
+            self._trigger_stops(ticker, [price])
+        return {"ticker": ticker, "price": price, "volume": sum(qty for _, _, qty in fills), "trades": len(fills),
+                "cancelled": len(cancelled)}
+
+    def _match(self, new_order: SimOrder) -> List[int]:
+        # the settlement is checked leg by leg before any order changes, so a rejected order
+        # leaves everything as it was, like the rolled back transaction does
+        if new_order.status in TERMINAL_STATUSES:
+            raise Rejected(424, "Cannot execute completed order", "order")
+        engine = self.engine
+        fills = engine.match(new_order.ticker, new_order.direction, new_order.price, new_order.qty - new_order.filled,
+                             new_order.user_id, new_order.self_trade_prevention)
+        matched = [self.orders[engine.order_id(handle)] for handle, _, _, _ in fills]
+        changed: Dict[Tuple[str, str], int] = {}
+        for match_order, qty, trade_price in rules.planned_trades(fills, matched):
+            for user_id, ticker, amount in rules.settlement_legs(new_order, match_order, qty, trade_price):
+                key = (user_id, ticker)
+                changed[key] = rules.apply_leg(changed[key] if key in changed else self.balances.get(key), ticker, amount)
+        self.balances.update(changed)
+
+        trades, _, remaining_qty = rules.apply_match(new_order, fills, matched)
+        for match_order, qty, trade_price in trades:
+            self._out.append({"type": "trade", "ticker": new_order.ticker, "qty": qty, "price": trade_price,
+                              "taker_order_id": new_order.id, "maker_order_id": match_order.id})
+        engine.apply(fills)
+        if rules.rests(new_order, remaining_qty):
+            engine.add(new_order.id, new_order.user_id, new_order.ticker, new_order.direction,
+                       new_order.price, new_order.qty, new_order.filled)
+        return [trade_price for _, _, trade_price in trades]
+
+    def _trigger_stops(self, ticker: str, trade_prices: List[int]) -> None:
+        engine = self.engine
+        pending = deque(engine.trigger(ticker, trade_prices))
+        while pending:
+            stop_order = self.orders.get(pending.popleft())
+            if stop_order is None or stop_order.status in TERMINAL_STATUSES:
+                continue
+            stop_order.triggered = True
+            if rules.trigger_blocked(engine, stop_order):
+                stop_order.status = OrderStatus.CANCELLED
+            else:
+                try:
+                    pending.extend(engine.trigger(ticker, self._match(stop_order)))
+                except Rejected:
+                    stop_order.status = OrderStatus.CANCELLED
+            self._out.append({"type": "triggered", "order_id": stop_order.id, "status": stop_order.status.value,
+                              "filled": stop_order.filled})
+
+
+def read_events(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def simulate(path: str, book_depth: int = 0) -> Iterator[dict]:
+    return Simulator(book_depth=book_depth).run(read_events(path))
+
+
+if __name__ == "__main__":
+    # python simulator.py events.ndjson [book depth] > results.ndjson
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    write = sys.stdout.write
+    for record in simulate(sys.argv[1], depth):
+        write(json.dumps(record, separators=(",", ":")) + "\n")
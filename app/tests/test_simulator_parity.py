@@ -0,0 +1,127 @@
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from models import Direction  # noqa: E402
+from simulator import Simulator  # noqa: E402
+
+ADMIN = {"Authorization": "TOKEN key-admin-67890"}
+USERS = 4
+RUB, MEM = 20000, 60
+EVENTS = 400
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # main recreates ./toy_exchange.db and ./archive on import, so import it from a scratch directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("exchange"))
+    import main
+    from fastapi.testclient import TestClient
+    try:
+        with TestClient(main.app) as c:
+            yield c
+    finally:
+        os.chdir(cwd)
+
+
+def _random_order(rng: random.Random) -> dict:
+    body = {"ticker": "MEM", "direction": rng.choice(["BUY", "SELL"]), "qty": rng.randint(1, 8)}
+    if rng.random() < 0.7:
+        body["price"] = rng.randint(95, 105)
+    if rng.random() < 0.15:
+        body["stop_price"] = rng.randint(95, 105)
+    if rng.random() < 0.2:
+        body["time_in_force"] = rng.choice(["IOC", "FOK"] + (["GTC"] if "price" in body else []))
+    if "price" in body and rng.random() < 0.1:
+        body["post_only"] = True
+    if rng.random() < 0.3:
+        body["self_trade_prevention"] = rng.choice(["NONE", "CANCEL_NEWEST", "CANCEL_OLDEST", "CANCEL_BOTH", "DECREMENT"])
+    if rng.random() < 0.2:
+        body["client_order_id"] = f"c{rng.randint(0, 20)}"
+    return body
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_simulator_matches_api(client, seed):
+    # the same random event stream goes through the HTTP API and the simulator; every accept or
+    # reject code, the final orders, balances, book and trade tape must agree
+    rng = random.Random(seed)
+    ticker = "PAR" + "ABC"[seed - 1]
+    client.post("/api/v1/admin/instrument", json={"name": ticker, "ticker": ticker}, headers=ADMIN)
+    sim = Simulator()
+    sim.step({"type": "instrument", "ticker": ticker})
+    users = []
+    for i in range(USERS):
+        user = client.post("/api/v1/public/register", json={"name": f"parity{seed}-{i}"}).json()
+        for t, amount in (("RUB", RUB), (ticker, MEM)):
+            client.post("/api/v1/admin/balance/deposit", json={"user_id": user["id"], "ticker": t, "amount": amount},
+                        headers=ADMIN)
+            sim.step({"type": "deposit", "user_id": user["id"], "ticker": t, "amount": amount})
+        users.append((user["id"], {"Authorization": "TOKEN " + user["api_key"]}))
+
+    placed = []
+    trades = Counter()
+
+    def step(event: dict) -> dict:
+        records = sim.step(event)
+        trades.update((r["qty"], r["price"]) for r in records if r["type"] == "trade")
+        return [r for r in records if r["type"] in (event["type"], "reject")][0]
+
+    for n in range(EVENTS):
+        user_id, headers = rng.choice(users)
+        roll = rng.random()
+        if roll < 0.03:
+            response = client.post(f"/api/v1/admin/instrument/{ticker}/auction", headers=ADMIN)
+            result = step({"type": "auction", "ticker": ticker})
+        elif roll < 0.06:
+            response = client.post(f"/api/v1/admin/instrument/{ticker}/auction/uncross", headers=ADMIN)
+            result = step({"type": "uncross", "ticker": ticker})
+        elif placed and roll < 0.2:
+            order_id, user_id, headers = rng.choice(placed)
+            response = client.delete(f"/api/v1/order/{order_id}", headers=headers)
+            result = step({"type": "cancel", "user_id": user_id, "order_id": order_id})
+        else:
+            body = dict(_random_order(rng), ticker=ticker)
+            response = client.post("/api/v1/order", json=body, headers=headers)
+            event = dict(body, type="order", user_id=user_id)
+            if response.status_code == 200:
+                event["order_id"] = response.json()["order_id"]
+            result = step(event)
+            if response.status_code == 200:
+                assert result.get("order_id") == event["order_id"], (n, body)
+                placed.append((event["order_id"], user_id, headers))
+        code = result["code"] if result["type"] == "reject" else 200
+        assert response.status_code == code, (n, response.text, result)
+
+    api_orders = {}
+    for user_id, headers in users:
+        for order in client.get("/api/v1/order", headers=headers).json():
+            if order["body"]["ticker"] == ticker:
+                api_orders[order["id"]] = (order["status"], order.get("filled", 0), order["body"]["qty"])
+    sim_orders = {o.id: (o.status.value, o.filled if o.price is not None else 0, o.qty) for o in sim.orders.values()}
+    assert api_orders == sim_orders
+
+    for user_id, headers in users:
+        balances = client.get("/api/v1/balance", headers=headers).json()
+        for t in ("RUB", ticker):
+            assert balances.get(t, 0) == sim.balances.get((user_id, t), 0), (user_id, t)
+
+    book = client.get(f"/api/v1/public/orderbook/{ticker}?limit=25").json()
+    assert book == {"bid_levels": sim.engine.levels(ticker, Direction.BUY, 25),
+                    "ask_levels": sim.engine.levels(ticker, Direction.SELL, 25)}
+
+    # the public tape is capped at 100 trades, so the fills are read from the database
+    import main
+    db = main.SessionLocal()
+    try:
+        tape = db.query(main.Transaction_BD.amount, main.Transaction_BD.price).filter(main.Transaction_BD.ticker == ticker)
+        assert Counter(tuple(t) for t in tape) == trades
+    finally:
+        db.close()
@@ -0,0 +1,24 @@
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+
+CASH_TICKER = "RUB"
+
+
+def price_vector(tickers: Sequence[str], last_prices: Dict[str, int]) -> np.ndarray:
+    # cash is worth its face value, instruments that never traded are marked at zero
+    return np.array([1 if t == CASH_TICKER else last_prices.get(t, 0) for t in tickers], dtype=np.int64)
+
+
+def mark_to_market(rows: List[Tuple[str, str, int]], last_prices: Dict[str, int]):
+    # rows are (user_id, ticker, amount) balances; returns the user ids, the tickers,
+    # the users x tickers holdings matrix and the per-user totals
+    if not rows:
+        return np.array([], dtype=str), np.array([], dtype=str), np.zeros((0, 0), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    user_col, ticker_col, amount_col = zip(*rows)
+    users, user_idx = np.unique(np.array(user_col), return_inverse=True)
+    tickers, ticker_idx = np.unique(np.array(ticker_col), return_inverse=True)
+    holdings = np.zeros((len(users), len(tickers)), dtype=np.int64)
+    holdings[user_idx, ticker_idx] = np.fromiter(amount_col, dtype=np.int64, count=len(amount_col))
+    totals = holdings @ price_vector(tickers.tolist(), last_prices)
+    return users, tickers, holdings, totals
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Callable, Dict, List
+
+
+class OrderWatch:
+    # Parks status readers until their order changes. Waiters are keyed by order id, so a
+    # notification wakes only the requests watching that order.
+    def __init__(self):
+        self.waiters: Dict[str, List[asyncio.Future]] = {}
+        self.listeners: List[Callable[[str], None]] = []
+
+    def __len__(self) -> int:
+        return sum(len(w) for w in self.waiters.values())
+
+    async def wait(self, order_id: str, timeout: float) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(order_id, []).append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self.waiters.get(order_id)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self.waiters[order_id]
+
+    def notify(self, order_id: str) -> None:
+        for listener in self.listeners:
+            listener(order_id)
+        for future in self.waiters.pop(order_id, ()):
+            if not future.done():
+                future.set_result(None)